@@ -2,13 +2,13 @@
 import logging
 import streamlit as st
 import pandas as pd
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Collection
 
 logger = logging.getLogger(__name__)
 
 class ChartsService:
     @staticmethod
-    def handle_charts(sheet_names: List[str], sheet_id: str, sheets_client) -> None:
+    def handle_charts(sheet_names: Collection[str], sheet_id: str, sheets_client) -> None:
         """Handle the CHARTS sheet functionality."""
         try:
             # Show Charts dropdown if CHARTS sheet exists
@@ -9,6 +9,9 @@ from utils.google_sheets import GoogleSheetsClient
 logger = logging.getLogger(__name__)
 
 class FormBuilderService:
+    def __init__(self, sheets_client: GoogleSheetsClient):
+        self.sheets_client = sheets_client
+
     @staticmethod
     def is_formula(value: Any) -> bool:
         """Check if a cell value is a formula."""
@@ -50,8 +53,7 @@ class FormBuilderService:
             logger.info(f"Checking formula in range: {cell_range}")
             
             # Get the cell data with specific formula information
-            client = GoogleSheetsClient()
-            result = client.sheets_service.spreadsheets().get(
+            result = self.sheets_client.sheets_service.spreadsheets().get(
                 spreadsheetId=spreadsheet_id,
                 ranges=[cell_range],
                 includeGridData=True
@@ -125,8 +127,7 @@ class FormBuilderService:
         """Determine field type using Google Sheets API format information."""
         try:
             # Get the format information for the first data row (row 2)
-            client = GoogleSheetsClient()
-            sheet = client.sheets_service.spreadsheets().get(
+            sheet = self.sheets_client.sheets_service.spreadsheets().get(
                 spreadsheetId=spreadsheet_id,
                 ranges=[f"{sheet_name}!{chr(65 + column_index)}2"],
                 includeGridData=True
@@ -424,6 +425,7 @@ class FormBuilderService:
                     
                 # Execute cell updates
                 update_success = SpreadsheetService.UpdateEntryCells(
+                    sheets_client=sheets_client,
                     spreadsheet_id=spreadsheet_id,
                     sheet_name=sheet_name,
                     cell_updates=cell_updates
@@ -1,6 +1,5 @@
 """Service for handling dynamic form operations."""
 import logging
-import time
 import streamlit as st
 from typing import Tuple, Any, Optional, List
 import pandas as pd
@@ -9,14 +8,17 @@ from utils import GoogleSheetsClient
 logger = logging.getLogger(__name__)
 
 class FormService:
+    # Field names in column A, values in column B; read all rows from 1 onwards
+    INPUTS_RANGE = "INPUTS!A1:B100"
+
     def __init__(self, sheets_client: GoogleSheetsClient):
         self.sheets_client = sheets_client
 
-    def get_input_field_data(self, spreadsheet_id: str) -> List[Tuple[str, Any]]:
-        """Get input field data from INPUTS sheet."""
+    def get_input_field_data(self, spreadsheet_id: str, cell_data: Optional[pd.DataFrame] = None) -> List[Tuple[str, Any]]:
+        """Get input field data from INPUTS sheet, or from an already-read INPUTS range."""
         try:
-            inputs_range = "INPUTS!A1:B100"  # Read all rows from 1 onwards
-            cell_data = self.sheets_client.read_spreadsheet(spreadsheet_id, inputs_range)
+            if cell_data is None:
+                cell_data = self.sheets_client.read_spreadsheet(spreadsheet_id, self.INPUTS_RANGE)
             
             if cell_data.empty:
                 logger.warning("No data found in INPUTS sheet")
@@ -55,7 +57,8 @@ class FormService:
             logger.error(f"Error reading input field data: {str(e)}")
             raise
 
-    def process_input_value(self, value: Any) -> Tuple[float, str]:
+    @staticmethod
+    def process_input_value(value: Any) -> Tuple[float, str]:
         """Process input value and return numeric value and display format."""
         try:
             if isinstance(value, str) and '%' in value:
@@ -80,174 +83,87 @@ class FormService:
             logger.error(f"Error processing input value: {str(e)}")
             raise
 
-    def handle_inputs_sheet(self, selected_sheet_id: str) -> bool:
+    @staticmethod
+    @st.cache_data(show_spinner=False, max_entries=32)
+    def prepare_input_fields(fields: Tuple[Tuple[str, Any], ...]) -> List[Tuple[str, Any, Optional[float], bool, Optional[float], Optional[str]]]:
+        """Precompute (name, value, numeric_value, is_percent, step, format) for each field."""
+        prepared = []
+        for field_name, current_value in fields:
+            numeric_value, display_value = FormService.process_input_value(current_value)
+            if numeric_value is None:
+                prepared.append((field_name, current_value, None, False, None, None))
+                continue
+            is_percent = isinstance(display_value, str) and '%' in display_value
+            step_size = 0.01 if is_percent or numeric_value < 10 else 1.0
+            format_str = "%.3f" if numeric_value < 10 else "%.2f"
+            prepared.append((field_name, current_value, numeric_value, is_percent, step_size, format_str))
+        return prepared
+
+    def handle_inputs_sheet(self, selected_sheet_id: str, cell_data: Optional[pd.DataFrame] = None) -> bool:
         """Handle the INPUTS sheet form display and processing."""
         try:
-            fields = self.get_input_field_data(selected_sheet_id)
+            fields = self.get_input_field_data(selected_sheet_id, cell_data)
             
             if not fields:
                 st.warning("No data found in INPUTS sheet. Please ensure the sheet has data.")
                 return False
             
-            # Create two columns for Inputs dropdown and button
-            col1, col2 = st.columns([4, 1])
-            
-            with col1:
-                display_choice = st.selectbox(
-                    "Inputs",
-                    options=["Display Inputs", "Hide Inputs"],
-                    key="inputs_selector",
-                    label_visibility="collapsed"
-                )
-            
-            with col2:
-                st.button("Update", key="display_inputs_btn")
+            display_choice = st.selectbox(
+                "Inputs",
+                options=["Display Inputs", "Hide Inputs"],
+                key="inputs_selector",
+                label_visibility="collapsed"
+            )
 
-            def create_callback(row):
-                def callback():
-                    actual_row = row
-                    logger.info("\n" + "="*80)
-                    logger.info(f"CALLBACK TRIGGERED for row {actual_row} (sheet row {actual_row})")
-                    logger.info("="*80 + "\n")
-                    try:
-                        input_key = f"input_numeric_{actual_row}"
-                        if input_key not in st.session_state:
-                            input_key = f"input_text_{actual_row}"
-                            
-                        logger.info(f"Processing callback for input {input_key} (sheet row {actual_row})")
-                        logger.info(f"All session state keys: {list(st.session_state.keys())}")
-                        logger.info(f"Current session state for {input_key}: {st.session_state.get(input_key)}")
-                        
-                        if input_key not in st.session_state:
-                            logger.error(f"Session state key {input_key} not found")
-                            return
-                            
-                        value = st.session_state[input_key]
-                        logger.info(f"Raw input value retrieved: {value} (type: {type(value)})")
-                        
-                        from services.spreadsheet_service import SpreadsheetService
-                        spreadsheet_service = SpreadsheetService(self.sheets_client)
-                        success = spreadsheet_service.update_input_cell(
-                            selected_sheet_id,
-                            str(value),
-                            row
-                        )
-                        
-                        if success:
-                            logger.info(f"✅ Successfully updated cell B{row} with value {value}")
-                            time.sleep(0.5)
-                            st.success("Updated successfully")
-                        else:
-                            logger.error(f"❌ Failed to update cell B{row}")
-                            st.error("Failed to update value")
-                            
-                    except Exception as e:
-                        logger.error(f"Error in callback: {str(e)}")
-                        st.error(f"Error updating field: {str(e)}")
-                return callback
+            def submit_inputs(rendered_inputs):
+                """Queue every edited input so they are written in one batch."""
+                from services.spreadsheet_service import SpreadsheetService
+                for row, input_key, original_value, is_percent in rendered_inputs:
+                    value = st.session_state.get(input_key)
+                    if value is None or value == original_value:
+                        continue
+                    # The percent flag was captured at render time, no re-read needed
+                    formatted_value = f"{float(value):.4f}" if is_percent else str(value)
+                    SpreadsheetService.enqueue_write(
+                        selected_sheet_id,
+                        f"INPUTS!B{row}",
+                        [[formatted_value]]
+                    )
+                    logger.info(f"Queued update of cell B{row} with value {formatted_value}")
 
             if display_choice == "Display Inputs":
-                for row_idx, (field_name, current_value) in enumerate(fields, start=2):
-                    numeric_value, display_value = self.process_input_value(current_value)
-                    
-                    if numeric_value is not None:
-                        step_size = 0.01 if isinstance(display_value, str) and '%' in display_value or numeric_value < 10 else 1.0
-                        input_key = f"input_numeric_{row_idx}"
-                        
-                        st.number_input(
-                            field_name,
-                            value=numeric_value,
-                            format="%.3f" if numeric_value < 10 else "%.2f",
-                            step=step_size,
-                            key=input_key,
-                            on_change=create_callback(row_idx),
-                            help=f"Column {row_idx}"
-                        )
-                    else:
-                        input_key = f"input_text_{row_idx}"
-                        
-                        st.text_input(
-                            field_name,
-                            value=str(current_value),
-                            key=input_key,
-                            on_change=create_callback(row_idx)
-                        )
-                        def callback():
-                            actual_row = row
-                            logger.info("\n" + "="*80)
-                            logger.info(f"CALLBACK TRIGGERED for row {actual_row} (sheet row {actual_row})")
-                            logger.info("="*80 + "\n")
-                            try:
-                                input_key = f"input_{row}"
-                                logger.info(f"Processing callback for input {input_key} (sheet row {actual_row})")
-                                logger.info(f"All session state keys: {list(st.session_state.keys())}")
-                                logger.info(f"Current session state for {input_key}: {st.session_state.get(input_key)}")
-                                
-                                if input_key not in st.session_state:
-                                    logger.error(f"Session state key {input_key} not found")
-                                    return
-                                    
-                                value = st.session_state[input_key]
-                                logger.info(f"Raw input value retrieved: {value} (type: {type(value)})")
-                                
-                                current_fields = self.get_input_field_data(selected_sheet_id)
-                                current_field_name = None
-                                current_field_value = None
-                                
-                                for field_name, field_value in current_fields:
-                                    if isinstance(field_value, str):
-                                        if field_value.endswith('%'):
-                                            current_field_value = field_value
-                                            current_field_name = field_name
-                                            break
-                                        elif field_value.startswith('$'):
-                                            current_field_value = field_value
-                                            current_field_name = field_name
-                                            break
-                                
-                                if current_field_value:
-                                    if '%' in current_field_value:
-                                        formatted_value = f"{float(value):.4f}"
-                                    elif current_field_value.startswith('$'):
-                                        clean_value = str(value).replace('$', '').replace(',', '')
-                                        formatted_value = f"{float(clean_value):.2f}"
-                                    else:
-                                        formatted_value = str(value)
-                                else:
-                                    formatted_value = str(value)
-                                    
-                                from services.spreadsheet_service import SpreadsheetService
-                                spreadsheet_service = SpreadsheetService(self.sheets_client)
-                                success = spreadsheet_service.update_input_cell(
-                                    selected_sheet_id,
-                                    formatted_value,
-                                    row
-                                )
-                                
-                                if success:
-                                    logger.info(f"✅ Successfully updated cell B{row} with value {formatted_value}")
-                                    time.sleep(0.5)
-                                    st.success(f"Updated {current_field_name}")
-                                else:
-                                    logger.error(f"❌ Failed to update cell B{row}")
-                                    st.error(f"Failed to update {current_field_name}")
-                                    
-                            except Exception as e:
-                                logger.error(f"Error in callback: {str(e)}")
-                                st.error(f"Error updating field: {str(e)}")
-                        return callback
+                # Edits stay local until Update is pressed, so N changes cost one write
+                rendered_inputs = []
+                with st.form("inputs_form"):
+                    prepared = self.prepare_input_fields(tuple(fields))
+                    for row_idx, (field_name, current_value, numeric_value, is_percent,
+                                  step_size, format_str) in enumerate(prepared, start=2):
+                        if numeric_value is not None:
+                            input_key = f"input_numeric_{row_idx}"
 
-                    # Remove duplicate input field generation
-                else:
-                    input_key = f"input_text_{row_idx}"
-                    callback_fn = create_callback(row_idx)
-                    st.session_state[f"callback_{input_key}"] = callback_fn
-                    
-                    st.text_input(
-                        field_name,
-                        value=str(current_value),
-                        key=input_key,
-                        on_change=st.session_state[f"callback_{input_key}"]
+                            st.number_input(
+                                field_name,
+                                value=numeric_value,
+                                format=format_str,
+                                step=step_size,
+                                key=input_key,
+                                help=f"Column {row_idx}"
+                            )
+                            rendered_inputs.append((row_idx, input_key, numeric_value, is_percent))
+                        else:
+                            input_key = f"input_text_{row_idx}"
+
+                            st.text_input(
+                                field_name,
+                                value=str(current_value),
+                                key=input_key
+                            )
+                            rendered_inputs.append((row_idx, input_key, str(current_value), False))
+
+                    st.form_submit_button(
+                        "Update",
+                        on_click=submit_inputs,
+                        args=(rendered_inputs,)
                     )
             return True
             
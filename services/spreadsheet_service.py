@@ -1,17 +1,29 @@
 """Service for handling spreadsheet operations."""
 import logging
 import traceback
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Collection
 import pandas as pd
+import streamlit as st
+from tenacity import (before_sleep_log, retry, retry_if_exception,
+                      stop_after_attempt, wait_exponential_jitter)
 from utils import GoogleSheetsClient
 
 logger = logging.getLogger(__name__)
 
+# Retry Sheets/Drive calls that hit the rate limit with jittered exponential backoff
+retry_on_rate_limit = retry(
+    retry=retry_if_exception(lambda e: 'RATE_LIMIT_EXCEEDED' in str(e)),
+    wait=wait_exponential_jitter(initial=1, max=16),
+    stop=stop_after_attempt(4),
+    before_sleep=before_sleep_log(logger, logging.WARNING),
+    reraise=True)
+
 class SpreadsheetService:
     def __init__(self, sheets_client: GoogleSheetsClient):
         self.sheets_client = sheets_client
         self.sheets_service = sheets_client.sheets_service
 
+    @retry_on_rate_limit
     def list_spreadsheets(self) -> List[Dict[str, str]]:
         """Get list of available spreadsheets."""
         try:
@@ -23,6 +35,7 @@ class SpreadsheetService:
             logger.error(f"Failed to list spreadsheets: {str(e)}")
             raise
 
+    @retry_on_rate_limit
     def get_sheet_metadata(self, spreadsheet_id: str) -> Dict[str, Any]:
         """Get metadata for a specific spreadsheet."""
         try:
@@ -44,87 +57,111 @@ class SpreadsheetService:
             # Use FORMATTED_VALUE to get calculated results instead of formulas
             df = self.sheets_client.read_spreadsheet(spreadsheet_id, range_name, value_render_option='FORMATTED_VALUE')
             
-            # Log DataFrame information after initial read
-            logger.info(f"Initial DataFrame for {sheet_name}:")
-            logger.info(f"Shape: {df.shape}")
-            logger.info(f"Columns: {df.columns.tolist()}")
-            logger.info(f"Data types: {df.dtypes.to_dict()}")
-            logger.info(f"First row: {df.iloc[0].tolist() if not df.empty else 'Empty DataFrame'}")
-            
-            # Process each column while preserving formatting
-            for col in df.columns:
-                if df[col].dtype == 'object':
-                    # Create a mask for currency values
-                    currency_mask = df[col].astype(str).str.contains('^\$', na=False)
-                    # Create a mask for percentage values
-                    percent_mask = df[col].astype(str).str.contains('%$', na=False)
-                    
-                    # Store the original formatted strings
-                    formatted_values = df[col].copy()
-                    
-                    try:
-                        # Convert currency values while preserving format
-                        if currency_mask.any():
-                            # Store original formatted strings
-                            df[col + '_formatted'] = formatted_values
-                            # Convert to numeric values for calculations
-                            df.loc[currency_mask, col] = df.loc[currency_mask, col].apply(
-                                lambda x: float(str(x).replace('$', '').replace(',', ''))
-                                if pd.notnull(x) and isinstance(x, str) else x
-                            )
+            return self._format_sheet_data(df, sheet_name)
+        except Exception as e:
+            logger.error(f"Failed to read sheet data: {str(e)}")
+            raise
+
+    def _format_sheet_data(self, df: pd.DataFrame, sheet_name: str) -> pd.DataFrame:
+        """Convert currency, percentage and numeric columns while keeping the formatted strings."""
+        # Log DataFrame information after initial read
+        logger.info(f"Initial DataFrame for {sheet_name}:")
+        logger.info(f"Shape: {df.shape}")
+        logger.info(f"Columns: {df.columns.tolist()}")
+        logger.info(f"Data types: {df.dtypes.to_dict()}")
+        logger.info(f"First row: {df.iloc[0].tolist() if not df.empty else 'Empty DataFrame'}")
+        
+        # Process each column while preserving formatting
+        for col in df.columns:
+            if df[col].dtype == 'object':
+                # Create a mask for currency values
+                currency_mask = df[col].astype(str).str.contains('^\$', na=False)
+                # Create a mask for percentage values
+                percent_mask = df[col].astype(str).str.contains('%$', na=False)
+                
+                # Store the original formatted strings
+                formatted_values = df[col].copy()
+                
+                try:
+                    # Convert currency values while preserving format
+                    if currency_mask.any():
+                        # Store original formatted strings
+                        df[col + '_formatted'] = formatted_values
+                        # Convert to numeric values for calculations
+                        df.loc[currency_mask, col] = df.loc[currency_mask, col].apply(
+                            lambda x: float(str(x).replace('$', '').replace(',', ''))
+                            if pd.notnull(x) and isinstance(x, str) else x
+                        )
 
-                        # Convert percentage values while preserving format and value
-                        elif percent_mask.any():
-                            # Store original formatted strings
-                            df[col + '_formatted'] = formatted_values
-                            # Convert to numeric values as full percentages
-                            df.loc[percent_mask, col] = df.loc[percent_mask, col].apply(
-                                lambda x: float(str(x).rstrip('%'))
-                                if pd.notnull(x) and isinstance(x, str) else x
-                            )
+                    # Convert percentage values while preserving format and value
+                    elif percent_mask.any():
+                        # Store original formatted strings
+                        df[col + '_formatted'] = formatted_values
+                        # Convert to numeric values as full percentages
+                        df.loc[percent_mask, col] = df.loc[percent_mask, col].apply(
+                            lambda x: float(str(x).rstrip('%'))
+                            if pd.notnull(x) and isinstance(x, str) else x
+                        )
 
-                        # Handle percentage fields (including Allocation, Rate, etc.)
-                        elif 'Allocation' in col or any(term in col for term in ['Rate', 'Yield']):
-                            # For decimal values (e.g., 0.59), convert to percentage string
-                            df[col + '_formatted'] = df[col].apply(
-                                lambda x: f"{float(x)*100:.2f}%" if isinstance(x, (int, float)) and x <= 1
-                                else (f"{float(str(x).rstrip('%')):.2f}%" if isinstance(x, str) and '%' in x
-                                else str(x))
-                            )
-                            # Store numeric value as percentage
-                            df[col] = df[col].apply(
-                                lambda x: float(str(x).rstrip('%')) if isinstance(x, str) and '%' in str(x)
-                                else float(x) * 100 if isinstance(x, (int, float)) and x <= 1
-                                else float(x)
-                            )
+                    # Handle percentage fields (including Allocation, Rate, etc.)
+                    elif 'Allocation' in col or any(term in col for term in ['Rate', 'Yield']):
+                        # For decimal values (e.g., 0.59), convert to percentage string
+                        df[col + '_formatted'] = df[col].apply(
+                            lambda x: f"{float(x)*100:.2f}%" if isinstance(x, (int, float)) and x <= 1
+                            else (f"{float(str(x).rstrip('%')):.2f}%" if isinstance(x, str) and '%' in x
+                            else str(x))
+                        )
+                        # Store numeric value as percentage
+                        df[col] = df[col].apply(
+                            lambda x: float(str(x).rstrip('%')) if isinstance(x, str) and '%' in str(x)
+                            else float(x) * 100 if isinstance(x, (int, float)) and x <= 1
+                            else float(x)
+                        )
 
-                        # Convert remaining numeric values
-                        else:
-                            remaining_mask = ~(currency_mask | percent_mask) & df[col].notna()
-                            if remaining_mask.any():
-                                temp_values = pd.to_numeric(df.loc[remaining_mask, col], errors='coerce')
-                                valid_numeric_mask = temp_values.notna()
-                                if valid_numeric_mask.any():
-                                    df.loc[remaining_mask[remaining_mask].index[valid_numeric_mask], col] = temp_values[valid_numeric_mask]
+                    # Convert remaining numeric values
+                    else:
+                        remaining_mask = ~(currency_mask | percent_mask) & df[col].notna()
+                        if remaining_mask.any():
+                            temp_values = pd.to_numeric(df.loc[remaining_mask, col], errors='coerce')
+                            valid_numeric_mask = temp_values.notna()
+                            if valid_numeric_mask.any():
+                                df.loc[remaining_mask[remaining_mask].index[valid_numeric_mask], col] = temp_values[valid_numeric_mask]
 
-                    except Exception as e:
-                        logger.debug(f"Conversion failed for column {col}: {str(e)}")
-                        continue
-                
-                # Ensure float columns maintain float type
-                elif df[col].dtype in ['float64', 'float32']:
-                    df[col] = df[col].astype('float64')
+                except Exception as e:
+                    logger.debug(f"Conversion failed for column {col}: {str(e)}")
+                    continue
             
-            # Log detailed information about the data types and sample values
-            logger.info(f"Successfully loaded data: {df.shape[0]} rows, {df.shape[1]} columns")
-            logger.info("Column types and sample values:")
-            for col in df.columns:
-                sample_values = df[col].head(3).tolist()
-                logger.info(f"Column '{col}': type={df[col].dtype}, samples={sample_values}")
-            logger.debug(f"Column types after conversion: {df.dtypes.to_dict()}")
-            return df
+            # Ensure float columns maintain float type
+            elif df[col].dtype in ['float64', 'float32']:
+                df[col] = df[col].astype('float64')
+        
+        # Log detailed information about the data types and sample values
+        logger.info(f"Successfully loaded data: {df.shape[0]} rows, {df.shape[1]} columns")
+        logger.info("Column types and sample values:")
+        for col in df.columns:
+            sample_values = df[col].head(3).tolist()
+            logger.info(f"Column '{col}': type={df[col].dtype}, samples={sample_values}")
+        logger.debug(f"Column types after conversion: {df.dtypes.to_dict()}")
+        return df
+
+    @retry_on_rate_limit
+    def batch_read_sheets(self, spreadsheet_id: str, sheet_ranges: Dict[str, str],
+                          raw_sheets: Collection[str] = ()) -> Dict[str, pd.DataFrame]:
+        """Read several sheets with one values.batchGet request.
+
+        sheet_ranges maps each sheet name to the A1 range to read. Sheets named in
+        raw_sheets are returned as read; the rest are formatted like read_sheet_data.
+        """
+        try:
+            logger.info(f"Batch reading sheets {list(sheet_ranges)} from spreadsheet {spreadsheet_id}")
+            frames = self.sheets_client.batch_read_spreadsheet(
+                spreadsheet_id, list(sheet_ranges.values()))
+            return {
+                sheet_name: df if sheet_name in raw_sheets else self._format_sheet_data(df, sheet_name)
+                for sheet_name, df in zip(sheet_ranges, frames)
+            }
         except Exception as e:
-            logger.error(f"Failed to read sheet data: {str(e)}")
+            logger.error(f"Failed to batch read sheet data: {str(e)}")
             raise
 
     def upload_csv_data(self, spreadsheet_id: str, sheet_name: str, df: pd.DataFrame) -> bool:
@@ -146,7 +183,9 @@ class SpreadsheetService:
                         # Use fixed precision for normal float values
                         df_formatted[col] = df_formatted[col].map(lambda x: f"{x:.2f}" if pd.notnull(x) else '')
             
-            values = [df_formatted.columns.tolist()] + df_formatted.values.tolist()
+            # One C-level conversion; remaining gaps become empty cells, not NaN
+            body = df_formatted.astype(object).where(df_formatted.notna(), '').to_numpy().tolist()
+            values = [df_formatted.columns.tolist()] + body
             logger.debug(f"Uploading data with types: {df_formatted.dtypes.to_dict()}")
             return self.sheets_client.write_to_spreadsheet(spreadsheet_id, range_name, values)
         except Exception as e:
@@ -212,13 +251,53 @@ class SpreadsheetService:
             logger.error(f"Full error details: {str(e)}")
             return False
 
+    @staticmethod
+    def enqueue_write(spreadsheet_id: str, range_name: str, values: List[List[Any]]) -> None:
+        """Queue a range write to be sent with the next flush_writes() call."""
+        pending = st.session_state.setdefault('pending_writes', {})
+        # Later writes to the same range replace earlier ones
+        pending.setdefault(spreadsheet_id, {})[range_name] = values
+        logger.debug(f"Queued write for {range_name} in spreadsheet {spreadsheet_id}")
+
+    def flush_writes(self) -> bool:
+        """Send all queued writes as one values.batchUpdate request per spreadsheet.
+
+        A spreadsheet's writes leave the queue only once its request succeeds;
+        failed ones stay queued for the next flush.
+        """
+        pending = st.session_state.get('pending_writes', {})
+        success = True
+        for spreadsheet_id, writes in list(pending.items()):
+            if not writes:
+                del pending[spreadsheet_id]
+                continue
+            body = {
+                'valueInputOption': 'USER_ENTERED',
+                'data': [{'range': range_name, 'values': values}
+                         for range_name, values in writes.items()]
+            }
+            try:
+                result = self.sheets_service.spreadsheets().values().batchUpdate(
+                    spreadsheetId=spreadsheet_id,
+                    body=body
+                ).execute()
+                logger.info(f"Flushed {len(writes)} queued write(s) to spreadsheet {spreadsheet_id}, "
+                            f"updated cells: {result.get('totalUpdatedCells', 0)}")
+                del pending[spreadsheet_id]
+            except Exception as e:
+                logger.error(f"Error flushing queued writes: {str(e)}")
+                success = False
+        if not pending:
+            st.session_state.pop('pending_writes', None)
+        return success
 
     @staticmethod
-    def UpdateEntryCells(spreadsheet_id: str, sheet_name: str, cell_updates: list) -> bool:
+    def UpdateEntryCells(sheets_client: GoogleSheetsClient, spreadsheet_id: str, sheet_name: str, cell_updates: list) -> bool:
         """
         Update multiple cells in a sheet with provided values.
         
         Args:
+            sheets_client: Client whose sheets_service sends the batch update
             spreadsheet_id: The ID of the spreadsheet
             sheet_name: Name of the sheet to update
             cell_updates: List of updates in format [row1, col1, value1, row2, col2, value2, ...]
@@ -274,8 +353,7 @@ class SpreadsheetService:
                 'data': updates
             }
             
-            # Execute the batch update using the client singleton
-            client = GoogleSheetsClient()
+            # Execute the batch update using the caller's client
             # Log API method being used
             logger.info("Calling Google Sheets API Method: spreadsheets.values.batchUpdate")
             logger.info("API Request Parameters:")
@@ -286,7 +364,7 @@ class SpreadsheetService:
             logger.info(f"    - Updates Count: {len(body['data'])}")
             logger.info(f"    - Full Body: {body}")
             
-            result = client.sheets_service.spreadsheets().values().batchUpdate(
+            result = sheets_client.sheets_service.spreadsheets().values().batchUpdate(
                 spreadsheetId=spreadsheet_id,
                 body=body
             ).execute()
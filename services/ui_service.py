@@ -4,16 +4,33 @@ import streamlit as st
 import pandas as pd
 from services.copy_service import CopyService
 from services.form_builder_service import FormBuilderService
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, Optional, List, Tuple
 from datetime import datetime
+from collections import namedtuple
+import time
 import json
 
 logger = logging.getLogger(__name__)
 
+# Pending payment sessions older than this many seconds, or beyond the newest N,
+# are dropped
+PAYMENT_SESSION_TTL = 3600
+MAX_PAYMENT_SESSIONS = 64
+
+# Context kept for a pending Stripe checkout; created_at is a time.time() stamp
+PaymentSession = namedtuple(
+    'PaymentSession',
+    'amount spreadsheet_id row_number created_at status sheet_name username selected_sheet form_data',
+    defaults=('pending', None, None, None, None))
+
 class UIService:
     @staticmethod
     def is_admin() -> bool:
         """Check if current user has admin privileges."""
+        # Reuse the flag captured once per session instead of re-reading the URL
+        query_params = st.session_state.get('query_params')
+        if query_params is not None:
+            return query_params['admin']
         return 'admin' in st.query_params
     @staticmethod
     def format_output_value(value_str: str, field_name: str) -> str:
@@ -53,8 +70,23 @@ class UIService:
             return value_str
 
     @staticmethod
-    def verify_payment_and_submit(session_id: str, sheets_client) -> bool:
-        """Verify payment and submit form if successful."""
+    def store_payment_session(session_id: str, session: PaymentSession) -> None:
+        """Remember a pending payment session and prune expired or surplus entries."""
+        sessions = st.session_state.setdefault('payment_sessions', {})
+        sessions[session_id] = session
+
+        # Entries are in insertion order, so stop at the first one worth keeping
+        cutoff = time.time() - PAYMENT_SESSION_TTL
+        for old_id in list(sessions):
+            if (len(sessions) <= MAX_PAYMENT_SESSIONS
+                    and sessions[old_id].created_at > cutoff):
+                break
+            del sessions[old_id]
+
+    @staticmethod
+    def verify_payment_and_submit(session_id: str, sheets_client,
+                                  on_write: Optional[Callable[[], None]] = None) -> bool:
+        """Verify payment and submit form if successful; on_write runs after the sheet update."""
         try:
             # Entry point logging with detailed information
             logger.info("="*80)
@@ -252,6 +284,7 @@ class UIService:
             # Execute the update
             try:
                 update_success = SpreadsheetService.UpdateEntryCells(
+                    sheets_client=sheets_client,
                     spreadsheet_id=spreadsheet_id,
                     sheet_name=sheet_name,
                     cell_updates=cell_updates
@@ -262,6 +295,8 @@ class UIService:
                 raise
 
             if update_success:
+                if on_write:
+                    on_write()
                 logger.info("Successfully updated payment status in sheet")
                 st.success("✅ Payment verified and entry updated successfully!")
                 return True
@@ -334,25 +369,37 @@ class UIService:
 
             st.divider()
 
+    @staticmethod
+    @st.cache_data(show_spinner=False, max_entries=16)
+    def summarize_missing_values(df: pd.DataFrame) -> List[Tuple[str, int, float, List[Any]]]:
+        """Return (column, missing count, percentage, row labels) for columns with gaps."""
+        null_mask = df.isnull()
+        null_counts = null_mask.sum()
+        summary = []
+        for col, count in null_counts[null_counts > 0].items():
+            null_rows = df.index[null_mask[col].to_numpy()].tolist()
+            summary.append((str(col), int(count), (count / len(df)) * 100, null_rows))
+        return summary
+
     @staticmethod
     def display_data_quality_report(df: pd.DataFrame):
         """Display data quality information."""
-        null_counts = df.isnull().sum()
-        has_nulls = null_counts.any()
+        summary = UIService.summarize_missing_values(df)
 
-        if has_nulls:
+        if summary:
             with st.expander("📊 Data Quality Report"):
                 st.warning("Some columns have missing values:")
-                for col in df.columns:
-                    null_rows = df[df[col].isnull()].index.tolist()
-                    if null_rows:
-                        percentage = (len(null_rows) / len(df)) * 100
-                        st.write(f"- {col}: {len(null_rows)} missing values ({percentage:.1f}%)")
-                        st.write(f"  Missing in rows: {', '.join(map(str, null_rows))}")
+                for col, count, percentage, null_rows in summary:
+                    st.write(f"- {col}: {count} missing values ({percentage:.1f}%)")
+                    st.write(f"  Missing in rows: {', '.join(map(str, null_rows))}")
 
     @staticmethod
-    def handle_append_entry(spreadsheet_id: str, sheet_name: str, sheets_client, form_builder_service) -> Optional[Dict[str, Any]]:
-        """Handle the dynamic form generation and submission for appending entries."""
+    def handle_append_entry(spreadsheet_id: str, sheet_name: str, sheets_client, form_builder_service,
+                            on_write: Optional[Callable[[], None]] = None) -> Optional[Dict[str, Any]]:
+        """Handle the dynamic form generation and submission for appending entries.
+
+        on_write is called once the entry row has been written to the sheet.
+        """
         try:
             logger.info("=" * 80)
             logger.info("FORM SUBMISSION PROCESS START")
@@ -406,7 +453,8 @@ class UIService:
                     spreadsheet_id=spreadsheet_id,
                     sheet_name=sheet_name,
                     sheets_client=sheets_client,
-                    form_data=form_data
+                    form_data=form_data,
+                    on_write=on_write
                 )
                 
                 # Check for payment redirection
@@ -434,7 +482,8 @@ class UIService:
         spreadsheet_id: str,
         sheet_name: str,
         sheets_client,
-        form_data: Dict[str, Any]
+        form_data: Dict[str, Any],
+        on_write: Optional[Callable[[], None]] = None
     ) -> Optional[Dict[str, Any]]:
         """Handle form submission with payment processing if required."""
         logger.info("=" * 80)
@@ -465,10 +514,14 @@ class UIService:
                 st.error("Failed to copy entry template")
                 return None
 
+            # The template row is in the sheet now, even if the update below fails
+            if on_write:
+                on_write()
+
             # Update cells with form data
             cell_updates = []
             df = sheets_client.read_spreadsheet(spreadsheet_id, f"{sheet_name}!A1:Z1000")
-            form_fields, _ = FormBuilderService().get_form_fields(df, spreadsheet_id, sheet_name)
+            form_fields, _ = FormBuilderService(sheets_client).get_form_fields(df, spreadsheet_id, sheet_name)
 
             for field_name, value in form_data.items():
                 field_info = next((f for f in form_fields if f['name'] == field_name), None)
@@ -477,6 +530,7 @@ class UIService:
                     cell_updates.extend([next_row, column_index, str(value)])
 
             update_success = SpreadsheetService.UpdateEntryCells(
+                sheets_client=sheets_client,
                 spreadsheet_id=spreadsheet_id,
                 sheet_name=sheet_name,
                 cell_updates=cell_updates
@@ -516,57 +570,32 @@ class UIService:
                             st.error(f"Payment Error: {payment_data['error']}")
                             return None
 
-                        # Store payment session with row information
-                        if 'payment_sessions' not in st.session_state:
-                            st.session_state.payment_sessions = {}
-                            
                         # Store session data and prepare payment URL
-                        session_data = {
-                            'amount': payment_amount,
-                            'form_data': form_data,
-                            'spreadsheet_id': spreadsheet_id,
-                            'sheet_name': sheet_name,
-                            'row_number': next_row,
-                            'username': st.session_state.get('username'),
-                            'selected_sheet': st.session_state.get('selected_sheet'),
-                            'timestamp': datetime.now().isoformat()
-                        }
+                        UIService.store_payment_session(payment_data['session_id'], PaymentSession(
+                            amount=payment_amount,
+                            spreadsheet_id=spreadsheet_id,
+                            row_number=next_row,
+                            created_at=time.time(),
+                            sheet_name=sheet_name,
+                            username=st.session_state.get('username'),
+                            selected_sheet=st.session_state.get('selected_sheet'),
+                            form_data=form_data
+                        ))
 
-                        # Store in session state
-                        st.session_state.payment_sessions[payment_data['session_id']] = session_data
-                        
                         # Return payment URL for redirection
                         return {
                             'payment_url': payment_data['session_url'],
                             'session_id': payment_data['session_id'],
                             'amount': payment_amount
                         }
-
-                        # Create session data with all necessary information
-                        session_data = {
-                            'amount': payment_amount,
-                            'form_data': form_data,
-                            'spreadsheet_id': spreadsheet_id,
-                            'sheet_name': sheet_name,
-                            'row_number': next_row,
-                            'username': st.session_state.get('username'),
-                            'selected_sheet': st.session_state.get('selected_sheet'),
-                            'timestamp': datetime.now().isoformat()
-                        }
-
-                        # Store in session state
-                        st.session_state.payment_sessions[payment_data['session_id']] = session_data
-                        logger.info("="*80)
-                        logger.info("STORING PAYMENT SESSION")
-                        logger.info(f"Session ID: {payment_data['session_id']}")
-                        logger.info(f"Session Data: {session_data}")
-                        logger.info("="*80)
-                        return None
                 except ValueError:
                     logger.error(f"Invalid payment amount: {form_data['Price']}")
                     st.error("Invalid payment amount specified")
                     return None
 
+            # No payment needed, the entry is complete
+            return {'row_number': next_row}
+
         except Exception as e:
             logger.error(f"Error in form submission: {str(e)}")
             st.error(f"Error submitting form: {str(e)}")
@@ -610,7 +639,8 @@ class UIService:
             return False
 
     @staticmethod
-    def display_copy_test_button(spreadsheet_id: str, copy_service: CopyService) -> None:
+    def display_copy_test_button(spreadsheet_id: str, copy_service: CopyService,
+                                 on_write: Optional[Callable[[], None]] = None) -> None:
         """Display test buttons and forms for various functionalities."""
         # Only show copy and test forms for admin users
         if not UIService.is_admin():
@@ -750,11 +780,14 @@ class UIService:
 
                     from services.spreadsheet_service import SpreadsheetService
                     success = SpreadsheetService.UpdateEntryCells(
+                        sheets_client=copy_service.sheets_client,
                         spreadsheet_id=spreadsheet_id,
                         sheet_name=sheet_name,
                         cell_updates=cell_updates
                     )
                     if success:
+                        if on_write:
+                            on_write()
                         st.success("✅ Cells updated successfully!")
                     else:
                         st.error("❌ Failed to update cells")
@@ -1 +1,2 @@
 from .google_sheets import GoogleSheetsClient
+from .cache import load_cached, save_cached, clear_cached
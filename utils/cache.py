@@ -0,0 +1,58 @@
+"""Disk-backed cache for API results that should survive new sessions."""
+import os
+import pickle
+import time
+import logging
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".instapp", "cache")
+
+
+def _cache_path(name: str) -> str:
+    """Return the pickle file path for a cache entry."""
+    return os.path.join(CACHE_DIR, f"{name}.pkl")
+
+
+def load_cached(name: str, ttl: float) -> Optional[Any]:
+    """Load a cached object if it exists and is younger than ttl seconds."""
+    path = _cache_path(name)
+    try:
+        age = time.time() - os.path.getmtime(path)
+        if age > ttl:
+            logger.debug(f"Cache entry '{name}' expired ({age:.0f}s old)")
+            return None
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Failed to load cache entry '{name}': {str(e)}")
+        return None
+
+
+def save_cached(name: str, obj: Any) -> bool:
+    """Persist an object to the disk cache."""
+    path = _cache_path(name)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Write to a temp file first so readers never see a partial pickle
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        return True
+    except Exception as e:
+        logger.warning(f"Failed to save cache entry '{name}': {str(e)}")
+        return False
+
+
+def clear_cached(name: str) -> None:
+    """Remove a cache entry from disk if present."""
+    try:
+        os.remove(_cache_path(name))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Failed to clear cache entry '{name}': {str(e)}")
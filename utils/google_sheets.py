@@ -2,17 +2,62 @@ import json
 import os
 import logging
 from typing import List, Dict, Any, Optional
+import google_auth_httplib2
+import httplib2
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
 import pandas as pd
+from tenacity import (before_sleep_log, retry, stop_after_attempt,
+                      wait_random_exponential)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Credentials keyed by (client_email, private_key_id, scopes)
+_credentials_cache: Dict[tuple, service_account.Credentials] = {}
+
+def _build_credentials(service_account_info: Dict[str, Any], scopes: tuple) -> service_account.Credentials:
+    """Build service account credentials once per key and scope set."""
+    key = (service_account_info['client_email'], service_account_info['private_key_id'], scopes)
+    credentials = _credentials_cache.get(key)
+    if credentials is None:
+        logger.debug("Building service account credentials")
+        credentials = service_account.Credentials.from_service_account_info(
+            service_account_info,
+            scopes=list(scopes)
+        )
+        _credentials_cache[key] = credentials
+    return credentials
+
+@retry(wait=wait_random_exponential(multiplier=1, max=8),
+       stop=stop_after_attempt(3),
+       before_sleep=before_sleep_log(logger, logging.WARNING),
+       reraise=True)
+def _build_services(credentials: service_account.Credentials) -> tuple:
+    """Build the Sheets and Drive API clients, retrying with jittered backoff.
+
+    The clients are shared by every session and background thread, but
+    httplib2.Http is not thread-safe, so each request gets its own connection.
+    """
+    # main.submit_background runs API calls on worker threads against these
+    # shared clients; do not reuse the base http object here
+    def build_request(http, *args, **kwargs):
+        new_http = google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http())
+        return HttpRequest(new_http, *args, **kwargs)
+
+    return tuple(
+        build(api, version,
+              http=google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http()),
+              requestBuilder=build_request)
+        for api, version in (('sheets', 'v4'), ('drive', 'v3')))
+
+
 class GoogleSheetsClient:
-    def __init__(self):
+    def __init__(self, credentials_dict: Optional[Dict[str, Any]] = None):
+        self.credentials_dict = credentials_dict
         self.scopes = [
             'https://www.googleapis.com/auth/spreadsheets.readonly',
             'https://www.googleapis.com/auth/spreadsheets',
@@ -58,45 +103,33 @@ class GoogleSheetsClient:
         }
 
         try:
-            # Get and validate service account JSON
-            service_account_json = os.getenv('GOOGLE_SERVICE_ACCOUNT_JSON')
-            if not service_account_json:
-                raise ValueError("GOOGLE_SERVICE_ACCOUNT_JSON environment variable is not set")
-
-            try:
-                service_account_info = json.loads(service_account_json)
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON parsing error: {str(e)}")
-                logger.error(f"Invalid JSON near position {e.pos}: {e.msg}")
-                raise ValueError(f"Failed to parse service account JSON: {str(e)}")
+            # Use the parsed credentials when given, otherwise read the environment
+            if self.credentials_dict is not None:
+                service_account_info = self.credentials_dict
+            else:
+                service_account_json = os.getenv('GOOGLE_SERVICE_ACCOUNT_JSON')
+                if not service_account_json:
+                    raise ValueError("GOOGLE_SERVICE_ACCOUNT_JSON environment variable is not set")
+
+                try:
+                    service_account_info = json.loads(service_account_json)
+                except json.JSONDecodeError as e:
+                    logger.error(f"JSON parsing error: {str(e)}")
+                    logger.error(f"Invalid JSON near position {e.pos}: {e.msg}")
+                    raise ValueError(f"Failed to parse service account JSON: {str(e)}")
 
             # Validate the service account JSON structure and content
             self._validate_service_account_json(service_account_info)
 
-            # Initialize credentials
-            self.credentials = service_account.Credentials.from_service_account_info(
-                service_account_info,
-                scopes=self.scopes
-            )
+            # Initialize credentials (shared across clients built from the same JSON)
+            self.credentials = _build_credentials(service_account_info, tuple(self.scopes))
             status['authenticated'] = True
             logger.info("Successfully authenticated with service account")
 
             # Initialize services with retry logic
-            import time
-            retries = 3
-            for attempt in range(retries):
-                try:
-                    self.sheets_service = build('sheets', 'v4', credentials=self.credentials)
-                    self.drive_service = build('drive', 'v3', credentials=self.credentials)
-                    status['connected'] = True
-                    logger.info("Successfully connected to Google Sheets and Drive APIs")
-                    break
-                except Exception as e:
-                    if attempt < retries - 1:
-                        logger.warning(f"Connection attempt {attempt + 1} failed: {str(e)}. Retrying...")
-                        time.sleep(2 ** attempt)  # Exponential backoff
-                    else:
-                        raise
+            self.sheets_service, self.drive_service = _build_services(self.credentials)
+            status['connected'] = True
+            logger.info("Successfully connected to Google Sheets and Drive APIs")
 
         except Exception as e:
             error_msg = f"Failed to initialize Google Sheets client: {str(e)}"
@@ -144,29 +177,60 @@ class GoogleSheetsClient:
                 valueRenderOption=value_render_option
             ).execute()
             
-            # Extract values from the response
-            values = result.get('values', [])
-            if not values:
-                logger.warning(f"No data found for range {range_name}")
-                return pd.DataFrame()
-
-            # Convert to DataFrame directly
-            df = pd.DataFrame(values)
-            
-            # Use first row as headers if available
-            if not df.empty:
-                df.columns = df.iloc[0]
-                df = df[1:].reset_index(drop=True)
-            return df
+            return self._values_to_dataframe(result.get('values', []), range_name)
 
         except HttpError as e:
-            error_msg = f"Failed to read spreadsheet: {str(e)}"
-            if e.resp.status == 403:
-                error_msg = "Permission denied. Please check read permissions for this spreadsheet"
-            elif e.resp.status == 404:
-                error_msg = "Spreadsheet not found. Please check the spreadsheet ID"
-            logger.error(error_msg)
-            raise Exception(error_msg)
+            self._raise_read_error(e)
+
+    def batch_read_spreadsheet(self, spreadsheet_id: str, ranges: List[str], value_render_option: str = 'FORMATTED_VALUE') -> List[pd.DataFrame]:
+        """Read several ranges in one values.batchGet request, one DataFrame per range."""
+        if not self.connection_status['connected']:
+            raise ConnectionError("Google Sheets client is not properly connected")
+
+        try:
+            logger.debug(f"Batch fetching data from spreadsheet {spreadsheet_id}, ranges: {ranges}")
+            result = self.sheets_service.spreadsheets().values().batchGet(
+                spreadsheetId=spreadsheet_id,
+                ranges=ranges,
+                valueRenderOption=value_render_option
+            ).execute()
+
+            # valueRanges come back in request order
+            value_ranges = result.get('valueRanges', [])
+            return [
+                self._values_to_dataframe(value_range.get('values', []), range_name)
+                for range_name, value_range in zip(ranges, value_ranges)
+            ]
+
+        except HttpError as e:
+            self._raise_read_error(e)
+
+    @staticmethod
+    def _values_to_dataframe(values: List[List[Any]], range_name: str) -> pd.DataFrame:
+        """Build a DataFrame from a values response, using the first row as headers."""
+        if not values:
+            logger.warning(f"No data found for range {range_name}")
+            return pd.DataFrame()
+
+        # Convert to DataFrame directly
+        df = pd.DataFrame(values)
+        
+        # Use first row as headers if available
+        if not df.empty:
+            df.columns = df.iloc[0]
+            df = df[1:].reset_index(drop=True)
+        return df
+
+    @staticmethod
+    def _raise_read_error(e: HttpError) -> None:
+        """Log a failed read with a user-facing message and re-raise it."""
+        error_msg = f"Failed to read spreadsheet: {str(e)}"
+        if e.resp.status == 403:
+            error_msg = "Permission denied. Please check read permissions for this spreadsheet"
+        elif e.resp.status == 404:
+            error_msg = "Spreadsheet not found. Please check the spreadsheet ID"
+        logger.error(error_msg)
+        raise Exception(error_msg)
 
     def write_to_spreadsheet(self, spreadsheet_id: str, range_name: str, values: List[List[Any]]) -> bool:
         """Write data to a spreadsheet range using direct API call."""
@@ -183,18 +247,8 @@ class GoogleSheetsClient:
             logger.info(f"Values to write: {values}")
             logger.info("=" * 80)
 
-            # First verify if the range exists
-            try:
-                self.sheets_service.spreadsheets().values().get(
-                    spreadsheetId=spreadsheet_id,
-                    range=range_name
-                ).execute()
-            except HttpError as e:
-                if e.resp.status == 404:
-                    logger.error(f"Range {range_name} not found")
-                    return False
-                raise
-
+            # No separate existence check: a missing range makes the update
+            # itself fail with a 400, handled below, so one round-trip suffices
             # Prepare the update request
             update_body = {
                 'values': values,